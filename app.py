@@ -1,41 +1,45 @@
-from flask import Flask, request, jsonify
+import threading
+from flask import Flask, request
+from config import load_config
 from vk_api import VKAPI
-from vk_chatbot import VKChatBot
-import os
-from dotenv import load_dotenv
 
-# Load VK API tokens from the keys.env file
-load_dotenv(dotenv_path=r'C:\Users\wangr\PycharmProjects\pythonProject7\keys.env')
-vk_app_access_token = os.getenv('VK_API_TOKEN')
-load_dotenv(dotenv_path=r'C:\Users\wangr\PycharmProjects\pythonProject7\keys_chat.env')
-vk_chatbot_access_token = os.getenv('CHAT_TOKEN')
-
-if not vk_app_access_token:
-    raise ValueError("VK_API_TOKEN not found in environment variables.")
-
-if not vk_chatbot_access_token:
-    raise ValueError("CHAT_TOKEN not found in environment variables.")
+# Load VK API tokens and DB settings from the environment or the config file (see config.load_config)
+config = load_config()
+config.require("vk_api_token", "chat_token")
 
 # Create VKAPI instance for the application with the loaded token
-vk_app_api = VKAPI(vk_app_access_token)
+# (VK_API_TOKEN must be a user access token: users.search does not accept community tokens)
+vk_app_api = VKAPI(config.vk_api_token, db_params=config.db_params)
 
-# Create VKAPI instance for the chatbot with the loaded token
-vk_chatbot_api = VKAPI(vk_chatbot_access_token)
+# Create VKAPI instance for the chatbot with the loaded token (replies are sent on behalf of the community)
+vk_chatbot_api = VKAPI(config.chat_token, db_params=config.db_params)
 
 # Create the Flask app
 app = Flask(__name__)
 
-# Create the VKChatBot instance with the VKAPI for the chatbot
-vk_chatbot = VKChatBot()
 
 @app.route("/", methods=["POST"])
 def handle_message():
-    data = request.data.decode('utf-8')  # Get the raw string data from the request
-    vk_chatbot.set_vk_api_instance(vk_chatbot_api)  # Set the VKAPI instance for the VKChatBot
-    vk_chatbot.handle_message(data)  # Pass the raw string data to the chatbot for processing
-
-    # Respond with a success message
-    return jsonify({"status": "ok"})
+    data = request.get_json(force=True, silent=True)  # Parse the VK Callback API event
+    if not isinstance(data, dict):
+        return "Bad Request", 400
+
+    if data.get("type") == "confirmation":
+        # Return the confirmation string to verify the server address
+        return config.confirmation_code or ""
+
+    if data.get("type") == "message_new":
+        message = data["object"]["message"]
+        # The pair search takes a while, so it runs in the background and VK gets its answer right away.
+        # The search runs with the user token, the reply is sent with the community token
+        threading.Thread(
+            target=vk_app_api.process_user_message,
+            args=(message["from_id"], message.get("text", ""), vk_chatbot_api),
+            daemon=True,
+        ).start()
+
+    # VK expects the plain-text body "ok", otherwise it re-sends the event
+    return "ok"
 
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,111 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Модули, которые не должны загружаться при импорте точек входа
+LAZY_MODULES = ("requests", "psycopg2", "tqdm", "numpy")
+
+# Фиктивные токены: app.py загружает и проверяет конфигурацию при импорте
+STUB_ENV = {
+    "VK_API_TOKEN": "stub",
+    "CHAT_TOKEN": "stub",
+}
+
+# Целевое время холодного запуска в миллисекундах
+DEFAULT_TARGET_MS = 300
+
+# Веб-фреймворки, которые точка входа обязана импортировать сразу: их собственное время
+# импорта (измеренное на этой же машине) добавляется к цели модуля
+FRAMEWORK_MODULES = {
+    "app": "flask",
+}
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(module, runs):
+    """
+    Измеряет время холодного импорта модуля в отдельных процессах интерпретатора.
+
+    Параметры:
+        module (str): Имя импортируемого модуля.
+        runs (int): Количество запусков.
+
+    Возвращает:
+        tuple: Медианное время запуска в миллисекундах и список загруженных «ленивых» модулей.
+
+    Исключения:
+        RuntimeError: Если импорт модуля завершился ошибкой.
+    """
+    code = (
+        "import sys\n"
+        f"import {module}\n"
+        f"print(','.join(name for name in {LAZY_MODULES!r} if name in sys.modules))\n"
+    )
+    env = dict(os.environ)
+    env.update(STUB_ENV)
+    timings = []
+    loaded = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0:
+            raise RuntimeError(f"Не удалось импортировать {module}:\n{result.stderr}")
+        loaded = [name for name in result.stdout.strip().split(",") if name]
+    return statistics.median(timings), loaded
+
+
+def main():
+    """
+    Проверяет, что время холодного запуска точек входа не превышает целевое.
+
+    Возвращает:
+        int: Код завершения (0 - все модули уложились в цель, 1 - нет).
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк времени холодного запуска.")
+    parser.add_argument("modules", nargs="*", default=["main", "app", "vk_api"], help="Импортируемые модули.")
+    parser.add_argument("--runs", type=int, default=10, help="Количество запусков на модуль.")
+    parser.add_argument("--target-ms", type=float, default=DEFAULT_TARGET_MS, help="Целевое время запуска в мс.")
+    args = parser.parse_args()
+
+    baseline, _ = measure("sys", args.runs)
+    print(f"Запуск пустого интерпретатора: {baseline:.1f} мс")
+
+    ok = True
+    for module in args.modules:
+        try:
+            elapsed, loaded = measure(module, args.runs)
+        except RuntimeError as e:
+            print(e)
+            ok = False
+            continue
+
+        target_ms = args.target_ms
+        framework = FRAMEWORK_MODULES.get(module)
+        if framework:
+            framework_elapsed, _ = measure(framework, args.runs)
+            target_ms += framework_elapsed - baseline
+
+        status = "OK" if elapsed <= target_ms and not loaded else "FAIL"
+        print(f"{module}: {elapsed:.1f} мс (импорт {elapsed - baseline:.1f} мс), цель {target_ms:.0f} мс [{status}]")
+        if framework:
+            print(f"  цель включает импорт {framework}: {framework_elapsed - baseline:.1f} мс")
+        if loaded:
+            print(f"  загружены при импорте: {', '.join(loaded)}")
+        ok = ok and status == "OK"
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import os
+
+# Каталог проекта, относительно которого ищутся файлы с токенами по умолчанию
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Файлы с переменными окружения, загружаемые, если путь к конфигурации не указан
+DEFAULT_ENV_FILES = ("keys.env", "keys_chat.env")
+
+# Переменная окружения с путем к файлу конфигурации
+CONFIG_PATH_VARIABLE = "SOUL_SEEKER_CONFIG"
+
+# Параметры подключения к PostgreSQL по умолчанию и переменные окружения, которые их переопределяют.
+# Пароль не имеет значения по умолчанию и задается только через DB_PASSWORD
+DEFAULT_DB_PARAMS = {
+    "host": ("DB_HOST", "localhost"),
+    "database": ("DB_NAME", "postgres"),
+    "user": ("DB_USER", "postgres"),
+    "password": ("DB_PASSWORD", None),
+}
+
+
+class Config:
+    """
+    Класс с настройками приложения, собранными из переменных окружения.
+
+    Атрибуты:
+        vk_api_token (str): Токен VK API приложения (VK_API_TOKEN).
+        chat_token (str): Токен VK API чат-бота (CHAT_TOKEN).
+        photo_cache_dir (str): Каталог локального кэша фотографий (PHOTO_CACHE_DIR).
+        confirmation_code (str): Строка подтверждения адреса сервера для Callback API (VK_CONFIRMATION_CODE).
+        db_params (dict): Параметры подключения к PostgreSQL (DB_HOST, DB_NAME, DB_USER, DB_PASSWORD).
+    """
+    def __init__(self, environ):
+        """
+        Инициализирует объект Config из словаря переменных окружения.
+
+        Параметры:
+            environ (dict): Переменные окружения.
+
+        Возвращает:
+            None
+        """
+        self.vk_api_token = environ.get("VK_API_TOKEN")
+        self.chat_token = environ.get("CHAT_TOKEN")
+        self.photo_cache_dir = environ.get("PHOTO_CACHE_DIR")
+        self.confirmation_code = environ.get("VK_CONFIRMATION_CODE")
+        self.db_params = {
+            name: environ.get(variable, default)
+            for name, (variable, default) in DEFAULT_DB_PARAMS.items()
+        }
+
+    def require(self, *names):
+        """
+        Проверяет, что указанные настройки заданы.
+
+        Параметры:
+            names (str): Имена атрибутов конфигурации.
+
+        Исключения:
+            ValueError: Если хотя бы одна из настроек не задана.
+        """
+        missing = [name for name in names if not getattr(self, name)]
+        if missing:
+            variables = ", ".join(name.upper() for name in missing)
+            raise ValueError(f"{variables} не найден в переменных окружения.")
+
+
+def load_config(path=None):
+    """
+    Загружает конфигурацию приложения.
+
+    Переменные окружения процесса имеют приоритет над значениями из файлов.
+    Файл конфигурации берется из аргумента path, переменной окружения
+    SOUL_SEEKER_CONFIG или, если они не заданы, из файлов keys.env и keys_chat.env
+    в каталоге проекта.
+
+    Параметры:
+        path (str, optional): Путь к файлу конфигурации в формате .env.
+
+    Возвращает:
+        Config: Объект с настройками приложения.
+
+    Исключения:
+        FileNotFoundError: Если явно указанный файл конфигурации не существует.
+    """
+    path = path or os.getenv(CONFIG_PATH_VARIABLE)
+    if path:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Файл конфигурации не найден: {path}")
+        env_files = [path]
+    else:
+        env_files = [os.path.join(BASE_DIR, name) for name in DEFAULT_ENV_FILES]
+        env_files = [env_file for env_file in env_files if os.path.isfile(env_file)]
+
+    if env_files:
+        # python-dotenv нужен только при наличии файлов конфигурации
+        from dotenv import load_dotenv
+        for env_file in env_files:
+            load_dotenv(dotenv_path=env_file, override=False)
+
+    return Config(os.environ)
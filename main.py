@@ -1,28 +1,57 @@
-import os
-from dotenv import load_dotenv
+import threading
+import time
+from config import load_config
 from vk_api import VKAPI
 
+# Интервал между проверками срока хранения фотографий в секундах
+RETENTION_CHECK_INTERVAL = 3600
+
+
+def run_retention(vk_api):
+    """
+    Периодически удаляет устаревшие партиции фотографий в фоновом потоке,
+    не задерживая сбор и сохранение новых фотографий.
+
+    Параметры:
+        vk_api (VKAPI): Экземпляр VKAPI, через который выполняется очистка.
+    """
+    while True:
+        vk_api.purge_expired_photos()
+        time.sleep(RETENTION_CHECK_INTERVAL)
+
+
 def main():
     """
     Основной скрипт для запуска чат-бота VKinder.
 
-    Использует токен VK API, который должен быть задан в файле keys.env.
+    Использует токен VK API, который должен быть задан в переменной окружения VK_API_TOKEN
+    или в файле конфигурации (см. config.load_config).
+    Если задана переменная окружения PHOTO_CACHE_DIR, фотографии кэшируются локально
+    и отправляются как вложения сообщений.
     Создает экземпляр VKAPI для взаимодействия с API VK и обработки сообщений.
     Запускает прослушивание входящих сообщений от пользователей.
 
     Raises:
         ValueError: Если VK_API_TOKEN не найден в переменных окружения.
     """
-    # Загрузка токена VK API из файла keys.env
-    load_dotenv(dotenv_path=r'C:\Users\wangr\PycharmProjects\pythonProject7\keys.env')
-    vk_app_access_token = os.getenv('VK_API_TOKEN')
+    # Загрузка конфигурации и подтверждение токена VK API
+    config = load_config()
+    config.require("vk_api_token")
 
-    # Подтверждение токена VK API
-    if not vk_app_access_token:
-        raise ValueError("VK_API_TOKEN не найден в переменных окружения.")
+    # Создание локального кэша фотографий (необязательно)
+    photo_cache = None
+    if config.photo_cache_dir:
+        from photo_cache import PhotoCache
+        photo_cache = PhotoCache(config.photo_cache_dir)
 
     # Создание экземпляра VKAPI
-    vk_api = VKAPI(vk_app_access_token)
+    vk_api = VKAPI(config.vk_api_token, photo_cache=photo_cache, db_params=config.db_params)
+
+    # Создание или миграция схемы базы данных (то же самое делает команда: python storage.py migrate)
+    vk_api.prepare_database()
+
+    # Запуск фоновой очистки устаревших фотографий
+    threading.Thread(target=run_retention, args=(vk_api,), daemon=True).start()
 
     try:
         # Запуск прослушивания сообщений от пользователей
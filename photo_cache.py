@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+
+class PhotoCache:
+    """
+    Класс для контентно-адресуемого локального кэша фотографий и вложений сообщений.
+
+    Фотографии скачиваются потоково (без буферизации целого изображения в памяти) и
+    сохраняются на диск под именем, равным SHA-256 их содержимого. Идентификаторы
+    загруженных вложений кэшируются по тому же хэшу, поэтому одна и та же фотография
+    скачивается и загружается в ВКонтакте только один раз. Соответствия URL -> хэш и
+    хэш -> вложение сохраняются в файле index.json в каталоге кэша и переживают перезапуск.
+
+    Параметры:
+        cache_dir (str): Каталог для хранения фотографий.
+        max_bytes (int, optional): Максимальный суммарный размер файлов в кэше.
+        max_attachments (int, optional): Максимальное количество кэшируемых вложений.
+
+    Атрибуты:
+        CHUNK_SIZE (int): Размер блока при потоковом скачивании в байтах.
+        DOWNLOAD_TIMEOUT (int): Таймаут скачивания фотографии в секундах.
+        INDEX_FILE (str): Имя файла с сохраненными соответствиями URL и вложений.
+
+    Методы:
+        fetch(url, session): Возвращает хэш локальной копии фотографии, скачивая ее при необходимости.
+        get_attachment(url, session, upload): Возвращает идентификатор вложения для фотографии.
+    """
+    CHUNK_SIZE = 64 * 1024
+    DOWNLOAD_TIMEOUT = 30
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, max_attachments=10000):
+        """
+        Инициализирует объект PhotoCache и восстанавливает список уже сохраненных файлов.
+
+        Параметры:
+            cache_dir (str): Каталог для хранения фотографий.
+            max_bytes (int, optional): Максимальный суммарный размер файлов в кэше. По умолчанию 512 МБ.
+            max_attachments (int, optional): Максимальное количество кэшируемых вложений. По умолчанию 10000.
+
+        Возвращает:
+            None
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_attachments = max_attachments
+        self.total_bytes = 0
+
+        # Все словари упорядочены от давно использованных к недавно использованным (LRU)
+        self._urls = OrderedDict()  # url -> хэш содержимого
+        self._files = OrderedDict()  # хэш содержимого -> размер файла
+        self._attachments = OrderedDict()  # хэш содержимого -> идентификатор вложения
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+        self._load_index()
+
+    def _scan(self):
+        """
+        Восстанавливает список файлов кэша с диска, упорядочивая их по времени последнего доступа,
+        и удаляет временные файлы прерванных скачиваний.
+        """
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if prefix.endswith(".part"):
+                os.remove(prefix_dir)
+                continue
+            if not os.path.isdir(prefix_dir):
+                continue
+            for digest in os.listdir(prefix_dir):
+                if digest.endswith(".part"):
+                    continue
+                stat = os.stat(os.path.join(prefix_dir, digest))
+                entries.append((stat.st_atime, digest, stat.st_size))
+
+        for _, digest, size in sorted(entries):
+            self._files[digest] = size
+            self.total_bytes += size
+
+    def _load_index(self):
+        """
+        Загружает сохраненные соответствия URL -> хэш и хэш -> вложение для файлов, которые есть на диске.
+        """
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        try:
+            with open(index_path, encoding="utf-8") as index_file:
+                index = json.load(index_file)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            print(f"Индекс кэша фотографий поврежден и будет создан заново: {e}")
+            return
+
+        for url, digest in index.get("urls", []):
+            if digest in self._files:
+                self._urls[url] = digest
+        for digest, attachment in index.get("attachments", []):
+            if digest in self._files:
+                self._attachments[digest] = attachment
+
+    def _save_index(self):
+        """
+        Атомарно сохраняет соответствия URL -> хэш и хэш -> вложение в порядке LRU.
+        """
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as index_file:
+            json.dump({
+                "urls": list(self._urls.items()),
+                "attachments": list(self._attachments.items()),
+            }, index_file)
+        os.replace(tmp_path, index_path)
+
+    def _path(self, digest):
+        """
+        Возвращает путь к файлу кэша по хэшу содержимого.
+
+        Параметры:
+            digest (str): SHA-256 содержимого фотографии.
+
+        Возвращает:
+            str: Путь к файлу кэша.
+        """
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def _touch(self, digest):
+        """
+        Отмечает файл кэша как недавно использованный.
+
+        Параметры:
+            digest (str): SHA-256 содержимого фотографии.
+        """
+        self._files.move_to_end(digest)
+
+    def _evict(self):
+        """
+        Удаляет давно не использованные файлы, пока размер кэша превышает max_bytes.
+        """
+        evicted = False
+        while self.total_bytes > self.max_bytes and len(self._files) > 1:
+            evicted = True
+            digest, size = self._files.popitem(last=False)
+            self.total_bytes -= size
+            self._attachments.pop(digest, None)
+            try:
+                os.remove(self._path(digest))
+            except FileNotFoundError:
+                pass
+
+        # Удаляем ссылки на вытесненные файлы
+        if not evicted:
+            return
+        for url in [url for url, digest in self._urls.items() if digest not in self._files]:
+            del self._urls[url]
+
+    def _download(self, url, session):
+        """
+        Потоково скачивает фотографию во временный файл, одновременно вычисляя ее хэш.
+
+        Параметры:
+            url (str): URL фотографии.
+            session (requests.Session): Сессия для выполнения HTTP-запроса.
+
+        Возвращает:
+            str: SHA-256 содержимого фотографии.
+
+        Исключения:
+            requests.RequestException: Если произошла ошибка при скачивании фотографии.
+        """
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                with session.get(url, stream=True, timeout=self.DOWNLOAD_TIMEOUT) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        hasher.update(chunk)
+                        tmp_file.write(chunk)
+
+            digest = hasher.hexdigest()
+            if digest in self._files:
+                # Такое содержимое уже есть в кэше под другим URL
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(self._path(digest)), exist_ok=True)
+                os.replace(tmp_path, self._path(digest))
+                size = os.path.getsize(self._path(digest))
+                self._files[digest] = size
+                self.total_bytes += size
+            return digest
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def fetch(self, url, session):
+        """
+        Возвращает хэш локальной копии фотографии, скачивая ее только при первом обращении.
+
+        Параметры:
+            url (str): URL фотографии.
+            session (requests.Session): Сессия для выполнения HTTP-запроса.
+
+        Возвращает:
+            str: SHA-256 содержимого фотографии.
+
+        Исключения:
+            requests.RequestException: Если произошла ошибка при скачивании фотографии.
+        """
+        digest = self._urls.get(url)
+        if digest is None or digest not in self._files:
+            digest = self._download(url, session)
+            self._urls[url] = digest
+            self._touch(digest)
+            self._evict()
+            self._save_index()
+        else:
+            self._urls.move_to_end(url)
+            self._touch(digest)
+        return digest
+
+    def get_attachment(self, url, session, upload):
+        """
+        Возвращает идентификатор вложения для фотографии, скачивая и загружая ее только при необходимости.
+
+        Параметры:
+            url (str): URL фотографии.
+            session (requests.Session): Сессия для выполнения HTTP-запроса.
+            upload (callable): Функция, загружающая файл по пути и возвращающая идентификатор вложения.
+
+        Возвращает:
+            str: Идентификатор вложения в формате "photo<owner_id>_<id>[_<access_key>]" или None.
+
+        Исключения:
+            requests.RequestException: Если произошла ошибка при скачивании или загрузке фотографии.
+        """
+        digest = self.fetch(url, session)
+
+        attachment = self._attachments.get(digest)
+        if attachment is None:
+            attachment = upload(self._path(digest))
+            if attachment is None:
+                return None
+            self._attachments[digest] = attachment
+            if len(self._attachments) > self.max_attachments:
+                self._attachments.popitem(last=False)
+            self._save_index()
+        self._attachments.move_to_end(digest)
+        return attachment
@@ -0,0 +1,103 @@
+from collections import namedtuple
+
+try:
+    # orjson декодирует JSON в несколько раз быстрее стандартного модуля json
+    import orjson
+
+    def decode_json(raw):
+        return orjson.loads(raw)
+except ImportError:
+    import json
+
+    def decode_json(raw):
+        return json.loads(raw)
+
+# Компактная запись о фотографии: только поля, которые используются при сохранении и ранжировании
+PhotoRecord = namedtuple("PhotoRecord", ["photo_id", "url", "likes", "comments", "date"])
+
+# Политика выбора размера фотографии по умолчанию
+DEFAULT_SIZE_POLICY = "largest"
+
+
+def make_size_selector(policy=DEFAULT_SIZE_POLICY):
+    """
+    Создает функцию выбора размера фотографии по политике.
+
+    Поддерживаемые политики:
+        "largest": вариант с наибольшей шириной;
+        "max_width:<N>": наибольший вариант шириной не более N пикселей (или наименьший, если все шире);
+        "types:<t1>,<t2>,...": первый доступный вариант из перечисленных типов VK (например, "types:y,x,m"),
+            иначе вариант с наибольшей шириной.
+
+    Параметры:
+        policy (str, optional): Политика выбора размера. По умолчанию "largest".
+
+    Возвращает:
+        callable: Функция, принимающая список размеров VK и возвращающая URL выбранного размера.
+
+    Исключения:
+        ValueError: Если политика не поддерживается.
+    """
+    def largest(sizes):
+        return max(sizes, key=lambda size: size["width"])["url"]
+
+    if policy == "largest":
+        return largest
+
+    name, _, value = policy.partition(":")
+
+    if name == "max_width" and value.isdigit():
+        max_width = int(value)
+
+        def bounded(sizes):
+            fitting = [size for size in sizes if size["width"] <= max_width]
+            if fitting:
+                return max(fitting, key=lambda size: size["width"])["url"]
+            return min(sizes, key=lambda size: size["width"])["url"]
+        return bounded
+
+    if name == "types" and value:
+        preferred = [size_type.strip() for size_type in value.split(",") if size_type.strip()]
+
+        def by_type(sizes):
+            by_size_type = {size["type"]: size["url"] for size in sizes}
+            for size_type in preferred:
+                if size_type in by_size_type:
+                    return by_size_type[size_type]
+            return largest(sizes)
+        return by_type
+
+    raise ValueError(f"Неподдерживаемая политика выбора размера фотографии: {policy}")
+
+
+def parse_photos_page(raw, select_size):
+    """
+    Разбирает страницу ответа photos.get и сразу сокращает каждую фотографию до PhotoRecord.
+
+    Полные словари VK (все размеры, теги, репосты и т.д.) не сохраняются после разбора,
+    поэтому в памяти остаются только компактные записи.
+
+    Параметры:
+        raw (bytes): Тело ответа VK API.
+        select_size (callable): Функция выбора URL размера фотографии (см. make_size_selector).
+
+    Возвращает:
+        tuple: Общее количество фотографий пользователя, количество элементов на странице
+            и список PhotoRecord страницы, или (0, 0, []), если ответ не содержит фотографий.
+    """
+    response = decode_json(raw).get("response")
+    if not response or not response.get("items"):
+        return 0, 0, []
+
+    records = [
+        PhotoRecord(
+            item["id"],
+            select_size(item["sizes"]),
+            item.get("likes", {}).get("count", 0),
+            item.get("comments", {}).get("count", 0),
+            item["date"],
+        )
+        for item in response["items"]
+        if item.get("sizes")
+    ]
+    return response["count"], len(response["items"]), records
@@ -0,0 +1,67 @@
+import queue
+import threading
+
+# Маркер окончания данных в буфере
+_DONE = object()
+
+
+class _Failure:
+    """
+    Обертка для исключения, возникшего в фоновом потоке производителя.
+    """
+    def __init__(self, error):
+        self.error = error
+
+
+def iter_in_background(iterable, maxsize=4):
+    """
+    Итерирует по iterable в фоновом потоке через ограниченный буфер.
+
+    Пока потребитель обрабатывает очередной элемент (например, пишет в базу данных),
+    производитель уже получает следующие (например, загружает страницы из API).
+    Если буфер заполнен, производитель ждет, поэтому в памяти находится не более
+    maxsize элементов. Исключение производителя повторно выбрасывается у потребителя.
+
+    Параметры:
+        iterable (iterable): Источник элементов, обходимый в фоновом потоке.
+        maxsize (int, optional): Размер буфера между производителем и потребителем. По умолчанию 4.
+
+    Возвращает:
+        generator: Генератор элементов iterable в исходном порядке.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(item):
+        # Периодически проверяем, не прекратил ли потребитель чтение
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
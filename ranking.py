@@ -0,0 +1,242 @@
+import datetime
+import numpy as np
+
+# Количество дней в месяцах невисокосного года
+DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def birthdays_to_ages(bdates, today=None):
+    """
+    Вычисляет полный возраст по датам рождения VK ("д.м.гггг") для всего массива сразу.
+
+    Параметры:
+        bdates (list): Даты рождения в формате "д.м.гггг" (None, пустые строки и даты без года допускаются).
+        today (datetime.date, optional): Текущая дата. По умолчанию сегодняшняя дата.
+
+    Возвращает:
+        numpy.ndarray: Возраст в полных годах (NaN, если год рождения неизвестен или дата некорректна).
+    """
+    today = today or datetime.date.today()
+    count = len(bdates)
+    ages = np.full(count, np.nan, dtype=np.float64)
+    if not count:
+        return ages
+
+    # Строки длиной до 10 байт ("дд.мм.гггг") разбираются как матрица байтов без цикла на Python
+    try:
+        raw = np.array([bdate or "" for bdate in bdates], dtype="S11")
+    except UnicodeEncodeError:
+        raw = np.array([bdate if bdate and bdate.isascii() else "" for bdate in bdates], dtype="S11")
+    chars = raw.view(np.uint8).reshape(count, 11)
+    columns = np.arange(11)
+
+    is_dot = chars == ord(".")
+    digits = chars - np.uint8(ord("0"))  # Не цифры дают значения больше 9 (переполнение uint8)
+    is_digit = digits <= 9
+    length = np.count_nonzero(chars, axis=1)
+    first_dot = is_dot.argmax(axis=1)
+    second_dot = (is_dot & (columns > first_dot[:, None])).argmax(axis=1)
+
+    valid = (
+        (np.count_nonzero(is_dot, axis=1) == 2)
+        & (np.count_nonzero(is_digit | is_dot, axis=1) == length)
+        & (first_dot >= 1) & (first_dot <= 2)
+        & (second_dot - first_dot >= 2) & (second_dot - first_dot <= 3)
+        & (length - second_dot == 5)
+    )
+    if not valid.any():
+        return ages
+
+    clean = np.where(is_digit, digits, 0).astype(np.int32)
+    rows = np.arange(count)
+
+    def digit(position):
+        # Цифра в указанном столбце каждой строки (позиции за пределами строки дают 0)
+        return clean[rows, np.minimum(position, 10)]
+
+    # Поля "д" и "м" занимают 1-2 символа, год - ровно 4 символа после второй точки
+    days = np.where(first_dot == 2, clean[:, 0] * 10 + clean[:, 1], clean[:, 0])
+    month_start = first_dot + 1
+    months = np.where(second_dot - first_dot == 3, digit(month_start) * 10 + digit(month_start + 1), digit(month_start))
+    year_start = second_dot + 1
+    years = digit(year_start) * 1000 + digit(year_start + 1) * 100 + digit(year_start + 2) * 10 + digit(year_start + 3)
+    # Невозможные даты ("31.2.2000", "29.2.2001") отбрасываются, как и в datetime.strptime
+    is_leap = ((years % 4 == 0) & (years % 100 != 0)) | (years % 400 == 0)
+    month_days = DAYS_IN_MONTH[np.clip(months, 1, 12) - 1] + ((months == 2) & is_leap)
+    valid &= (months >= 1) & (months <= 12) & (days >= 1) & (days <= month_days) & (years >= 1)
+
+    # Полный возраст, как в User.calculate_age: минус год, если день рождения в этом году еще не наступил
+    birthday_ahead = (months > today.month) | ((months == today.month) & (days > today.day))
+    ages[valid] = (today.year - years - birthday_ahead)[valid]
+    return ages
+
+
+class CandidateRanker:
+    """
+    Класс для ранжирования кандидатов в пары одним векторизованным проходом.
+
+    Пул кандидатов загружается в столбцовые массивы NumPy (разница в возрасте,
+    популярность фотографий, свежесть фотографий), после чего все кандидаты
+    оцениваются за один проход с настраиваемыми весами.
+
+    Параметры:
+        target_age (int): Возраст пользователя, для которого подбираются пары.
+        weights (dict, optional): Веса признаков. Ключи: "age", "popularity", "recency".
+
+    Атрибуты:
+        DEFAULT_WEIGHTS (dict): Веса признаков по умолчанию.
+        RECENCY_HALF_LIFE_DAYS (int): Период полураспада оценки свежести фотографий в днях.
+
+    Методы:
+        load(candidates, photo_stats): Загружает пул кандидатов в массивы NumPy.
+        load_arrays(ids, ages, popularity, last_photo_ts): Загружает готовые столбцы.
+        score(): Вычисляет оценки всех загруженных кандидатов.
+        top(n): Возвращает N лучших кандидатов.
+    """
+    DEFAULT_WEIGHTS = {
+        "age": 1.0,
+        "popularity": 1.0,
+        "recency": 0.5,
+    }
+    RECENCY_HALF_LIFE_DAYS = 365
+
+    def __init__(self, target_age, weights=None):
+        """
+        Инициализирует объект CandidateRanker.
+
+        Параметры:
+            target_age (int): Возраст пользователя, для которого подбираются пары.
+            weights (dict, optional): Веса признаков, переопределяющие DEFAULT_WEIGHTS.
+
+        Исключения:
+            ValueError: Если передан неизвестный признак.
+        """
+        self.target_age = target_age
+        self.weights = dict(self.DEFAULT_WEIGHTS)
+        if weights:
+            unknown = set(weights) - set(self.DEFAULT_WEIGHTS)
+            if unknown:
+                raise ValueError(f"Неизвестные признаки ранжирования: {', '.join(sorted(unknown))}")
+            self.weights.update(weights)
+
+        self.candidates = []
+        self.ids = np.empty(0, dtype=np.int64)
+        self.ages = np.empty(0, dtype=np.float64)
+        self.popularity = np.empty(0, dtype=np.float64)
+        self.last_photo_ts = np.empty(0, dtype=np.float64)
+
+    def load(self, candidates, photo_stats=None):
+        """
+        Загружает пул кандидатов в столбцовые массивы NumPy.
+
+        Даты рождения разбираются одним векторизованным проходом (birthdays_to_ages),
+        а статистика фотографий сопоставляется с кандидатами через сортированный поиск.
+
+        Параметры:
+            candidates (list): Список словарей кандидатов в формате search_users().
+            photo_stats (dict, optional): Словарь {user_vk_id: (популярность, timestamp последней фотографии)}.
+
+        Возвращает:
+            CandidateRanker: Текущий объект для цепочки вызовов.
+        """
+        ids = np.fromiter((candidate["id"] for candidate in candidates), dtype=np.int64, count=len(candidates))
+        ages = birthdays_to_ages([candidate.get("Birthday") for candidate in candidates])
+
+        popularity = np.zeros(len(ids), dtype=np.float64)
+        last_photo_ts = np.full(len(ids), np.nan, dtype=np.float64)
+
+        if photo_stats and len(ids):
+            stat_ids = np.fromiter(photo_stats.keys(), dtype=np.int64, count=len(photo_stats))
+            stat_values = np.array(
+                [(stats[0] or 0, np.nan if stats[1] is None else stats[1]) for stats in photo_stats.values()],
+                dtype=np.float64,
+            ).reshape(-1, 2)
+
+            # Находим позиции статистики в пуле кандидатов без словаря на весь пул
+            order = np.argsort(ids, kind="stable")
+            positions = np.searchsorted(ids[order], stat_ids)
+            positions = np.minimum(positions, len(ids) - 1)
+            found = ids[order][positions] == stat_ids
+            targets = order[positions[found]]
+            popularity[targets] = stat_values[found, 0]
+            last_photo_ts[targets] = stat_values[found, 1]
+
+        return self.load_arrays(ids, ages, popularity, last_photo_ts, candidates)
+
+    def load_arrays(self, ids, ages, popularity, last_photo_ts, candidates=None):
+        """
+        Загружает уже подготовленные столбцы без построчной обработки.
+
+        Параметры:
+            ids (array-like): VK ID кандидатов.
+            ages (array-like): Возраст кандидатов (NaN, если неизвестен).
+            popularity (array-like): Суммарные лайки и комментарии фотографий.
+            last_photo_ts (array-like): Unix-время последней фотографии (NaN, если фотографий нет).
+            candidates (list, optional): Исходные записи кандидатов в том же порядке.
+
+        Возвращает:
+            CandidateRanker: Текущий объект для цепочки вызовов.
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.ages = np.asarray(ages, dtype=np.float64)
+        self.popularity = np.asarray(popularity, dtype=np.float64)
+        self.last_photo_ts = np.asarray(last_photo_ts, dtype=np.float64)
+        self.candidates = list(candidates) if candidates is not None else self.ids.tolist()
+        return self
+
+    def score(self, now=None):
+        """
+        Вычисляет оценки всех загруженных кандидатов одним векторизованным проходом.
+
+        Параметры:
+            now (float, optional): Текущее Unix-время. По умолчанию время вызова.
+
+        Возвращает:
+            numpy.ndarray: Массив оценок в порядке загрузки кандидатов.
+        """
+        if now is None:
+            now = datetime.datetime.now().timestamp()
+
+        # Чем меньше разница в возрасте, тем выше оценка; неизвестный возраст дает 0
+        age_delta = np.abs(self.ages - self.target_age)
+        age_score = np.nan_to_num(1.0 / (1.0 + age_delta), nan=0.0)
+
+        # Логарифмическая шкала, чтобы единичные «звезды» не подавляли остальных
+        popularity_score = np.log1p(np.maximum(self.popularity, 0.0))
+        max_popularity = popularity_score.max(initial=0.0)
+        if max_popularity > 0:
+            popularity_score /= max_popularity
+
+        # Экспоненциальное затухание по возрасту последней фотографии
+        age_days = np.maximum(now - self.last_photo_ts, 0.0) / 86400.0
+        recency_score = np.nan_to_num(np.exp2(-age_days / self.RECENCY_HALF_LIFE_DAYS), nan=0.0)
+
+        return (
+            self.weights["age"] * age_score
+            + self.weights["popularity"] * popularity_score
+            + self.weights["recency"] * recency_score
+        )
+
+    def top(self, n, now=None):
+        """
+        Возвращает N кандидатов с наибольшей оценкой.
+
+        Параметры:
+            n (int): Количество кандидатов для возврата.
+            now (float, optional): Текущее Unix-время для оценки свежести фотографий.
+
+        Возвращает:
+            list: Записи кандидатов, упорядоченные по убыванию оценки.
+        """
+        count = len(self.ids)
+        if n <= 0 or count == 0:
+            return []
+
+        scores = self.score(now)
+        if n < count:
+            # Частичная сортировка: O(N) отбор и сортировка только лучших n
+            best = np.argpartition(-scores, n - 1)[:n]
+        else:
+            best = np.arange(count)
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [self.candidates[i] for i in best]
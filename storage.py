@@ -0,0 +1,281 @@
+import datetime
+import psycopg2
+from psycopg2 import errors
+
+# Префикс имен партиций таблицы 'user_photos': user_photos_pГГГГММДД
+PARTITION_PREFIX = "user_photos_p"
+
+# Сколько дней вперед создавать партиции, чтобы сбор фотографий не ждал DDL
+PARTITIONS_AHEAD = 2
+
+# Максимальное время ожидания блокировки при удалении партиций на PostgreSQL < 14
+RETENTION_LOCK_TIMEOUT = "1s"
+
+# Версия PostgreSQL, начиная с которой поддерживается DETACH PARTITION ... CONCURRENTLY
+CONCURRENT_DETACH_VERSION = 140000
+
+CREATE_USERS_QUERY = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_vk_id BIGINT PRIMARY KEY,
+        first_name TEXT,
+        last_name TEXT,
+        sex SMALLINT,
+        bdate TEXT,
+        city TEXT
+    );
+"""
+
+CREATE_USER_PHOTOS_QUERY = """
+    CREATE TABLE user_photos (
+        user_vk_id BIGINT NOT NULL,
+        photo_url TEXT NOT NULL,
+        likes_count INTEGER NOT NULL DEFAULT 0,
+        comments_count INTEGER NOT NULL DEFAULT 0,
+        photo_date TIMESTAMP,
+        harvested_on DATE NOT NULL DEFAULT CURRENT_DATE
+    ) PARTITION BY RANGE (harvested_on);
+"""
+
+CREATE_USER_PHOTOS_INDEX_QUERY = """
+    CREATE INDEX IF NOT EXISTS user_photos_user_vk_id_idx ON user_photos (user_vk_id);
+"""
+
+# Партиции, существование которых уже проверено в текущем процессе
+_known_partitions = set()
+
+
+def connect(db_params):
+    """
+    Открывает подключение к базе данных PostgreSQL.
+
+    Параметры:
+        db_params (dict): Параметры подключения (см. config.Config.db_params).
+
+    Возвращает:
+        psycopg2.extensions.connection: Подключение к базе данных.
+    """
+    return psycopg2.connect(**db_params)
+
+
+def partition_name(day):
+    """
+    Возвращает имя партиции таблицы 'user_photos' для указанной даты сбора.
+
+    Параметры:
+        day (datetime.date): Дата сбора фотографий.
+
+    Возвращает:
+        str: Имя партиции.
+    """
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def migrate_schema(conn, today=None):
+    """
+    Создает схему базы данных или переводит существующую таблицу 'user_photos' в партиционированную.
+
+    Запускается при старте main.py или вручную командой:
+
+        python storage.py migrate
+
+    Если 'user_photos' - обычная таблица (схема до партиционирования), она переименовывается,
+    получает столбец harvested_on со вчерашней датой и подключается как партиция
+    на диапазон от MINVALUE до сегодняшнего дня. Данные не копируются, а старые строки
+    удаляются вместе с этой партицией по истечении срока хранения. Повторный запуск ничего не меняет.
+
+    Параметры:
+        conn (psycopg2.extensions.connection): Подключение к базе данных.
+        today (datetime.date, optional): Текущая дата. По умолчанию сегодняшняя дата.
+
+    Возвращает:
+        str: "created", "migrated" или "up-to-date".
+    """
+    today = today or datetime.date.today()
+    yesterday = today - datetime.timedelta(days=1)
+    legacy_name = partition_name(yesterday)
+
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(CREATE_USERS_QUERY)
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('user_photos')")
+            row = cursor.fetchone()
+
+            if row is None:
+                cursor.execute(CREATE_USER_PHOTOS_QUERY)
+                result = "created"
+            elif row[0] == "p":
+                result = "up-to-date"
+            else:
+                # Старая таблица становится партицией, чтобы не копировать данные
+                cursor.execute(f"ALTER TABLE user_photos RENAME TO {legacy_name}")
+                cursor.execute(
+                    f"ALTER TABLE {legacy_name} ADD COLUMN IF NOT EXISTS harvested_on DATE NOT NULL DEFAULT %s",
+                    (yesterday,),
+                )
+                cursor.execute(f"ALTER TABLE {legacy_name} ALTER COLUMN harvested_on SET DEFAULT CURRENT_DATE")
+                # Родительская таблица повторяет столбцы старой таблицы, иначе ATTACH PARTITION не пройдет
+                cursor.execute(
+                    f"CREATE TABLE user_photos (LIKE {legacy_name} INCLUDING DEFAULTS) "
+                    "PARTITION BY RANGE (harvested_on)"
+                )
+                cursor.execute(
+                    f"ALTER TABLE user_photos ATTACH PARTITION {legacy_name} "
+                    "FOR VALUES FROM (MINVALUE) TO (%s)",
+                    (today,),
+                )
+                result = "migrated"
+
+            cursor.execute(CREATE_USER_PHOTOS_INDEX_QUERY)
+
+    ensure_partitions(conn, today)
+    return result
+
+
+def ensure_partitions(conn, day=None):
+    """
+    Создает партиции таблицы 'user_photos' на указанную дату и PARTITIONS_AHEAD дней вперед.
+
+    Уже созданные в текущем процессе партиции повторно не проверяются, поэтому
+    вызов на горячем пути сбора фотографий почти ничего не стоит.
+
+    Параметры:
+        conn (psycopg2.extensions.connection): Подключение к базе данных.
+        day (datetime.date, optional): Дата сбора фотографий. По умолчанию сегодняшняя дата.
+    """
+    day = day or datetime.date.today()
+    days = [day + datetime.timedelta(days=offset) for offset in range(PARTITIONS_AHEAD + 1)]
+    missing = [d for d in days if d not in _known_partitions]
+    if not missing:
+        return
+
+    # Отдельная короткая транзакция, чтобы DDL не удерживал блокировки во время вставки данных
+    with conn:
+        with conn.cursor() as cursor:
+            for d in missing:
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(d)} PARTITION OF user_photos "
+                    "FOR VALUES FROM (%s) TO (%s)",
+                    (d, d + datetime.timedelta(days=1)),
+                )
+    _known_partitions.update(missing)
+
+
+def drop_expired_partitions(conn, retention_days, today=None):
+    """
+    Удаляет партиции таблицы 'user_photos' старше срока хранения.
+
+    Каждая партиция удаляется целиком за постоянное время, без построчного DELETE.
+    На PostgreSQL 14+ партиция сначала отключается командой DETACH PARTITION ... CONCURRENTLY,
+    которая не блокирует вставку и чтение 'user_photos', а затем удаляется отдельно.
+    На более старых версиях DROP TABLE берет исключительную блокировку родительской таблицы:
+    сбор фотографий может ждать не дольше RETENTION_LOCK_TIMEOUT, после чего удаление
+    откладывается до следующего запуска.
+
+    Параметры:
+        conn (psycopg2.extensions.connection): Подключение к базе данных.
+        retention_days (int): Срок хранения фотографий в днях.
+        today (datetime.date, optional): Текущая дата. По умолчанию сегодняшняя дата.
+
+    Возвращает:
+        list: Имена удаленных партиций.
+    """
+    today = today or datetime.date.today()
+    cutoff = today - datetime.timedelta(days=retention_days)
+    concurrent = conn.server_version >= CONCURRENT_DETACH_VERSION
+
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = 'user_photos';
+            """)
+            partitions = [row[0] for row in cursor.fetchall()]
+
+    expired = []
+    for name in partitions:
+        try:
+            day = datetime.datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+        except ValueError:
+            continue  # Игнорировать партиции, созданные не этим модулем
+        if day < cutoff:
+            expired.append(name)
+
+    dropped = []
+    for name in sorted(expired):
+        try:
+            if concurrent:
+                _detach_concurrently(conn, name)
+                with conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"DROP TABLE IF EXISTS {name}")
+            else:
+                with conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SET LOCAL lock_timeout = %s", (RETENTION_LOCK_TIMEOUT,))
+                        cursor.execute(f"DROP TABLE IF EXISTS {name}")
+            dropped.append(name)
+        except errors.LockNotAvailable:
+            print(f"Партиция {name} занята, удаление отложено до следующего запуска.")
+    return dropped
+
+
+def _detach_concurrently(conn, name):
+    """
+    Отключает партицию от 'user_photos' без блокировки вставки и чтения (PostgreSQL 14+).
+
+    DETACH ... CONCURRENTLY нельзя выполнять внутри транзакции, поэтому подключение
+    временно переводится в режим autocommit. Если предыдущее отключение было прервано,
+    оно завершается командой DETACH ... FINALIZE.
+
+    Параметры:
+        conn (psycopg2.extensions.connection): Подключение к базе данных.
+        name (str): Имя партиции.
+    """
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT inhdetachpending
+                FROM pg_inherits
+                WHERE inhrelid = to_regclass(%s);
+            """, (name,))
+            row = cursor.fetchone()
+            if row is None:
+                return  # Партиция уже отключена
+            if row[0]:
+                cursor.execute(f"ALTER TABLE user_photos DETACH PARTITION {name} FINALIZE")
+            else:
+                cursor.execute(f"ALTER TABLE user_photos DETACH PARTITION {name} CONCURRENTLY")
+    finally:
+        conn.autocommit = autocommit
+
+
+def truncate_all(conn):
+    """
+    Быстро очищает таблицы 'user_photos' и 'users' (для тестов и ручного сброса).
+
+    Параметры:
+        conn (psycopg2.extensions.connection): Подключение к базе данных.
+    """
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("TRUNCATE user_photos, users")
+
+
+if __name__ == "__main__":
+    import sys
+    from config import load_config
+
+    if sys.argv[1:] != ["migrate"]:
+        print("Использование: python storage.py migrate")
+        sys.exit(2)
+
+    connection = connect(load_config().db_params)
+    try:
+        print(f"Схема базы данных: {migrate_schema(connection)}")
+    finally:
+        connection.close()
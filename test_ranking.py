@@ -0,0 +1,44 @@
+import math
+
+from ranking import birthdays_to_ages
+from user import User
+
+
+def expected_age(bdate):
+    """
+    Возвращает возраст так, как его считает User.calculate_age (None, если дата не разбирается).
+    """
+    try:
+        return User(1, "Имя", "Фамилия", 1, bdate, None).calculate_age()
+    except ValueError:
+        return None
+
+
+def check(bdates):
+    # birthdays_to_ages и User.calculate_age по умолчанию считают возраст на сегодняшнюю дату
+    for bdate, age in zip(bdates, birthdays_to_ages(bdates)):
+        expected = expected_age(bdate)
+        if expected is None:
+            assert math.isnan(age), bdate
+        else:
+            assert age == expected, bdate
+
+
+def test_valid_dates_match_calculate_age():
+    check([
+        "1.3.2000", "01.03.2000", "29.2.2000", "28.2.1999", "29.02.2004",
+        "31.12.1990", "1.1.1990", "15.7.1985", "1.3.1",
+    ])
+
+
+def test_hidden_year_and_empty_dates_are_unknown():
+    ages = birthdays_to_ages(["1.3", "15.12", "", None])
+    assert all(math.isnan(age) for age in ages)
+
+
+def test_non_ascii_dates_are_unknown():
+    check(["１.２.２０００", "1.2.2000г", "а.б.вгде", "1.2.2000"])
+
+
+def test_impossible_dates_are_unknown():
+    check(["31.2.2000", "29.2.2001", "29.2.1900", "31.4.2000", "0.1.2000", "1.13.2000", "1.2.0000", "1.2.200"])
@@ -1,9 +1,11 @@
 import datetime
-import requests
-import psycopg2
+from pipeline import iter_in_background
+from photo_parser import decode_json, make_size_selector, parse_photos_page
 from user import User
 import time
-from tqdm import tqdm
+
+# Модули HTTP-клиента (requests), базы данных (psycopg2), ранжирования (numpy) и прогресса (tqdm)
+# импортируются внутри методов, которым они нужны, чтобы не замедлять запуск короткоживущих процессов.
 
 
 class VKAPI:
@@ -12,52 +14,103 @@ class VKAPI:
 
     Параметры:
         vk_access_token (str): Токен для доступа к API ВКонтакте.
+        photo_cache (PhotoCache, optional): Локальный кэш фотографий и вложений сообщений.
+        db_params (dict, optional): Параметры подключения к PostgreSQL (см. config.Config.db_params).
 
     Атрибуты:
         BASE_URL (str): Базовый URL для API ВКонтакте.
         MAX_REQUESTS_PER_SECOND (int): Максимальное количество запросов в секунду к API ВКонтакте.
         MAX_PHOTOS_PER_USER (int): Максимальное количество фотографий пользователя для поиска.
+        TOP_CANDIDATES (int): Количество лучших кандидатов, для которых собираются фотографии.
+        AGE_WINDOW (int): Допустимая разница в возрасте кандидатов в годах (дальше кандидаты ранжируются по возрасту).
+        RANKING_WEIGHTS (dict): Веса признаков ранжирования кандидатов (None - веса по умолчанию).
+        RETENTION_DAYS (int): Срок хранения собранных фотографий в днях.
+        PHOTO_BUFFER_PAGES (int): Количество страниц фотографий, загружаемых наперед во время записи в базу данных.
+        PHOTO_BATCH_SIZE (int): Минимальный размер пакета фотографий для записи в одной транзакции.
+        PHOTO_SIZE_POLICY (str): Политика выбора размера фотографии (см. photo_parser.make_size_selector).
+        PRELOAD_TOP_PHOTOS (int): Количество топ-фотографий кандидата, заранее загружаемых как вложения.
+        PRELOAD_CANDIDATES (int): Количество лучших кандидатов, для которых фотографии загружаются заранее.
 
     Методы:
         _make_request(method, params): Отправляет GET-запрос к API ВКонтакте и обрабатывает ответ.
         listen_for_messages(): Запускает прослушивание новых сообщений от пользователей.
         lookup_user_id_by_name(user_name): Ищет и возвращает VK ID пользователя по его имени.
         send_message(user_id, message, top_3_photos): Отправляет сообщение с указанным текстом и топ-3 фотографиями пользователю.
+        upload_message_photo(peer_id, photo_path): Загружает фотографию как вложение для сообщений.
+        prepare_database(): Создает схему базы данных или переводит ее на партиционированное хранение фотографий.
         clear_database(): Очищает базу данных от сохраненных пользователей и их фотографий.
+        purge_expired_photos(): Удаляет фотографии, собранные раньше срока хранения.
         get_user_and_search_pairs(user_vk_id): Получает информацию о пользователе и ищет совместимые пары.
+        process_user_message(user_id, message_text, messenger): Ищет пару для отправителя сообщения и отправляет ее.
         get_user_info_by_id(user_vk_id): Получает информацию о пользователе по его VK ID.
         search_users(search_params, user_info, max_users=1000): Ищет пользователей по указанным параметрам.
+        get_candidate_photo_stats(user_vk_ids): Получает статистику уже сохраненных фотографий кандидатов.
+        rank_candidates(candidates, age): Ранжирует кандидатов и возвращает лучших.
+        iter_user_photo_pages(user_vk_id): Постранично получает фотографии пользователя.
         get_all_user_photos(user_vk_id): Получает все фотографии пользователя.
         save_user_photos_to_db(user_vk_id): Сохраняет информацию о пользователе и его фотографии в базу данных.
+        get_top_photos(user_vk_id, limit): Получает самые популярные фотографии пользователя из базы данных.
+        preload_top_photos(user_vk_id): Заранее загружает топ-фотографии кандидата как вложения.
         send_top_photos_to_user(user_vk_id, user_info): Отправляет топ-3 популярных фотографии пользователю.
     """
     BASE_URL = "https://api.vk.com/method/"
     MAX_REQUESTS_PER_SECOND = 3
     MAX_PHOTOS_PER_USER = 1000
-
-    def __init__(self, vk_access_token):
+    TOP_CANDIDATES = 50
+    AGE_WINDOW = 5
+    RANKING_WEIGHTS = None
+    RETENTION_DAYS = 30
+    PHOTO_BUFFER_PAGES = 4
+    PHOTO_BATCH_SIZE = 200
+    PHOTO_SIZE_POLICY = "largest"
+    PRELOAD_TOP_PHOTOS = 3
+    PRELOAD_CANDIDATES = 1
+
+    def __init__(self, vk_access_token, photo_cache=None, db_params=None):
         """
         Инициализирует объект VKAPI с переданным токеном доступа VK.
 
         Параметры:
             vk_access_token (str): Токен доступа VK API.
+            photo_cache (PhotoCache, optional): Локальный кэш фотографий. Если задан, фотографии
+                отправляются как вложения сообщений, а не как ссылки.
+            db_params (dict, optional): Параметры подключения к PostgreSQL. По умолчанию из load_config().
 
         Возвращает:
             None
         """
         self.access_token = vk_access_token
-        self.session = requests.Session()
+        self._session = None
+        self.photo_cache = photo_cache
+        if db_params is None:
+            from config import load_config
+            db_params = load_config().db_params
+        self.db_params = db_params
+        self.select_photo_size = make_size_selector(self.PHOTO_SIZE_POLICY)
+
+    @property
+    def session(self):
+        """
+        HTTP-сессия для запросов к API ВКонтакте, создаваемая при первом обращении.
 
-    def _make_request(self, method, params):
+        Возвращает:
+            requests.Session: HTTP-сессия.
         """
-        Отправляет GET-запрос к API ВКонтакте и обрабатывает ответ.
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def _make_raw_request(self, method, params):
+        """
+        Отправляет GET-запрос к API ВКонтакте и возвращает тело ответа без разбора.
 
         Параметры:
             method (str): Название метода API ВКонтакте.
             params (dict): Параметры запроса к API ВКонтакте.
 
         Возвращает:
-            dict: Результат запроса в формате JSON.
+            bytes: Тело ответа в формате JSON.
 
         Исключения:
             ConnectionError: Если произошла ошибка при подключении к API ВКонтакте.
@@ -67,12 +120,27 @@ class VKAPI:
         params["v"] = "5.131"
 
         response = self.session.get(url, params=params)
-        response_json = response.json()
 
         if response.status_code != 200:
-            raise ConnectionError(f"Ошибка в запросе к API ВКонтакте: {response_json.get('error')}")
+            raise ConnectionError(f"Ошибка в запросе к API ВКонтакте: {decode_json(response.content).get('error')}")
+
+        return response.content
 
-        return response_json.get("response")
+    def _make_request(self, method, params):
+        """
+        Отправляет GET-запрос к API ВКонтакте и обрабатывает ответ.
+
+        Параметры:
+            method (str): Название метода API ВКонтакте.
+            params (dict): Параметры запроса к API ВКонтакте.
+
+        Возвращает:
+            dict: Результат запроса в формате JSON.
+
+        Исключения:
+            ConnectionError: Если произошла ошибка при подключении к API ВКонтакте.
+        """
+        return decode_json(self._make_raw_request(method, params)).get("response")
 
     def listen_for_messages(self):
         """
@@ -81,6 +149,8 @@ class VKAPI:
         Обработка сообщений выполняется в методе process_user_message().
         Если произошла ошибка при прослушивании или отправке сообщений, она будет выведена в консоль.
         """
+        import requests
+
         api_version = "5.131"
         url = f"https://api.vk.com/method/messages.getLongPollServer"
         params = {
@@ -184,6 +254,8 @@ class VKAPI:
         Исключения:
             requests.RequestException: Если произошла ошибка при отправке сообщения.
         """
+        import requests
+
         api_version = "5.131"
         url = f"https://api.vk.com/method/messages.send"
         params = {
@@ -195,6 +267,19 @@ class VKAPI:
         }
 
         try:
+            # Фотографии из локального кэша прикладываются к сообщению как вложения,
+            # остальные отправляются ссылками отдельными сообщениями
+            attachments = []
+            photos_as_links = []
+            for photo in top_3_photos:
+                attachment = self._get_photo_attachment(user_id, photo["photo_url"])
+                if attachment:
+                    attachments.append(attachment)
+                else:
+                    photos_as_links.append(photo)
+            if attachments:
+                params["attachment"] = ",".join(attachments)
+
             response = requests.post(url, params=params)
             response_data = response.json()
             if "error" in response_data:
@@ -202,10 +287,10 @@ class VKAPI:
             else:
                 print(f"Сообщение отправлено пользователю {user_id}: {message}")
 
-            # Отправляем топ-3 фотографии как отдельные сообщения пользователю
-            for i, photo in enumerate(top_3_photos, 1):
-                photo_message = f"Топ-3 Фото {i}:\n{photo['photo_url']}"
-                params["message"] = photo_message
+            # Отправляем фотографии без вложений как отдельные сообщения пользователю
+            params.pop("attachment", None)
+            for i, photo in enumerate(photos_as_links, 1):
+                params["message"] = f"Топ-3 Фото {i}:\n{photo['photo_url']}"
                 response = requests.post(url, params=params)
                 response_data = response.json()
                 if "error" in response_data:
@@ -217,35 +302,152 @@ class VKAPI:
         except requests.RequestException as e:
             print(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
 
-    def clear_database(self):
+    def _get_photo_attachment(self, peer_id, photo_url):
         """
-        Очищает базу данных от сохраненных пользователей и их фотографий.
+        Возвращает идентификатор вложения для фотографии из локального кэша.
+
+        Параметры:
+            peer_id (int): VK ID получателя сообщения или None при предварительной загрузке.
+            photo_url (str): URL фотографии.
+
+        Возвращает:
+            str: Идентификатор вложения или None, если кэш не настроен или загрузка не удалась.
         """
-        conn = psycopg2.connect(
-            host="localhost",
-            database="postgres",
-            user="postgres",
-            password=""
-        )
+        if self.photo_cache is None:
+            return None
+
+        import requests
 
         try:
-            cursor = conn.cursor()
+            return self.photo_cache.get_attachment(
+                photo_url,
+                self.session,
+                lambda photo_path: self.upload_message_photo(peer_id, photo_path),
+            )
+        except requests.RequestException as e:
+            print(f"Не удалось подготовить вложение для фото {photo_url}: {e}")
+            return None
+
+    def upload_message_photo(self, peer_id, photo_path):
+        """
+        Загружает фотографию на сервер ВКонтакте как вложение для сообщений.
+
+        Параметры:
+            peer_id (int): VK ID получателя сообщения или None, если получатель еще неизвестен.
+            photo_path (str): Путь к файлу фотографии.
+
+        Возвращает:
+            str: Идентификатор вложения в формате "photo<owner_id>_<id>[_<access_key>]" или None.
 
-            # Начинаем транзакцию для атомарной операции
-            with conn:
-                # Удаляем все записи из таблицы 'user_photos'
-                delete_user_photos_query = "DELETE FROM user_photos"
-                cursor.execute(delete_user_photos_query)
+        Исключения:
+            requests.RequestException: Если произошла ошибка при загрузке фотографии.
+        """
+        params = {"peer_id": peer_id} if peer_id is not None else {}
+        upload_server = self._make_request("photos.getMessagesUploadServer", params)
+        if not upload_server or "upload_url" not in upload_server:
+            return None
+
+        with open(photo_path, "rb") as photo_file:
+            try:
+                # requests_toolbelt (если установлен) передает файл потоком, без сборки тела запроса в памяти
+                from requests_toolbelt import MultipartEncoder
+            except ImportError:
+                # Без requests_toolbelt тело multipart-запроса целиком собирается в памяти
+                upload_response = self.session.post(
+                    upload_server["upload_url"],
+                    files={"photo": ("photo.jpg", photo_file, "image/jpeg")},
+                )
+            else:
+                encoder = MultipartEncoder(fields={"photo": ("photo.jpg", photo_file, "image/jpeg")})
+                upload_response = self.session.post(
+                    upload_server["upload_url"],
+                    data=encoder,
+                    headers={"Content-Type": encoder.content_type},
+                )
+        upload_response.raise_for_status()
+        upload_data = upload_response.json()
+
+        saved = self._make_request("photos.saveMessagesPhoto", {
+            "photo": upload_data.get("photo"),
+            "server": upload_data.get("server"),
+            "hash": upload_data.get("hash"),
+        })
+        if not saved:
+            return None
+
+        photo = saved[0]
+        attachment = f"photo{photo['owner_id']}_{photo['id']}"
+        if photo.get("access_key"):
+            attachment += f"_{photo['access_key']}"
+        return attachment
+
+    def prepare_database(self):
+        """
+        Создает схему базы данных или переводит существующую таблицу 'user_photos'
+        на партиционированное по дате сбора хранение (см. storage.migrate_schema).
+
+        Возвращает:
+            bool: True, если схема готова к работе, в противном случае False.
+        """
+        import storage
 
-                # Удаляем все записи из таблицы 'users'
-                delete_users_query = "DELETE FROM users"
-                cursor.execute(delete_users_query)
+        conn = None
 
+        try:
+            conn = storage.connect(self.db_params)
+            result = storage.migrate_schema(conn)
+            print(f"Схема базы данных: {result}")
+            return True
+        except Exception as e:
+            print(f"Ошибка при подготовке схемы базы данных: {e}")
+            return False
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def clear_database(self):
+        """
+        Очищает базу данных от сохраненных пользователей и их фотографий.
+        """
+        import storage
+
+        conn = None
+
+        try:
+            conn = storage.connect(self.db_params)
+            # TRUNCATE освобождает таблицы целиком, без построчного DELETE
+            storage.truncate_all(conn)
             print("База данных успешно очищена!")
         except Exception as e:
             print(f"Ошибка при очистке базы данных: {e}")
         finally:
-            conn.close()
+            if conn is not None:
+                conn.close()
+
+    def purge_expired_photos(self):
+        """
+        Удаляет партиции таблицы 'user_photos' старше RETENTION_DAYS дней.
+
+        Возвращает:
+            list: Имена удаленных партиций.
+        """
+        import storage
+
+        conn = None
+
+        try:
+            # Подключение внутри try: недоступная база данных не должна останавливать фоновую очистку
+            conn = storage.connect(self.db_params)
+            dropped = storage.drop_expired_partitions(conn, self.RETENTION_DAYS)
+            if dropped:
+                print(f"Удалены устаревшие партиции фотографий: {', '.join(dropped)}")
+            return dropped
+        except Exception as e:
+            print(f"Ошибка при удалении устаревших фотографий: {e}")
+            return []
+        finally:
+            if conn is not None:
+                conn.close()
 
     def get_user_and_search_pairs(self, user_vk_id):
         """
@@ -255,7 +457,8 @@ class VKAPI:
             user_vk_id (int): VK ID пользователя.
 
         Возвращает:
-            User: Объект User с информацией о пользователе или None, если информация не найдена.
+            list: Словари кандидатов, чьи фотографии сохранены в базу данных, в порядке убывания оценки,
+                или None, если информация о пользователе недоступна или поиск завершился ошибкой.
 
         Исключения:
             ConnectionError: Если произошла ошибка при подключении к API ВКонтакте.
@@ -297,9 +500,9 @@ class VKAPI:
             # Пример параметров поиска, вы можете их изменить по своим требованиям
             search_params = {
                 "sex": 2 if user_info.sex == 1 else 1,  # Женский пол (1 для мужчин, 2 для женщин)
-                "age_from": age - 1,
+                "age_from": age - self.AGE_WINDOW,
                 "age": age,
-                "age_to": age + 1,
+                "age_to": age + self.AGE_WINDOW,
                 "city": user_info.city["id"],
             }
 
@@ -317,6 +520,14 @@ class VKAPI:
                 total_users = len(search_results)
                 print(f"Поиск завершен, найдено пользователей противоположного пола: {total_users}")
 
+                # Собираем фотографии только для лучших кандидатов
+                search_results = self.rank_candidates(search_results, age)
+                print(f"Отобрано лучших кандидатов: {len(search_results)}")
+
+                from tqdm import tqdm
+
+                saved_candidates = []
+
                 # Сохранение информации о пользователе и фотографий в базу данных PostgreSQL
                 for user in tqdm(search_results):
                     user_id = user["id"]
@@ -326,6 +537,7 @@ class VKAPI:
                         if success:
                             print(
                                 f"Информация и фотографии пользователя {user['First Name']} {user['Last Name']} успешно сохранены в базу данных!")
+                            saved_candidates.append(user)
                         else:
                             print(
                                 f"Не удалось сохранить информацию и фотографии пользователя {user['First Name']} {user['Last Name']} в базу данных.")
@@ -335,8 +547,45 @@ class VKAPI:
                         print(f"Ошибка значения при сохранении данных в базу данных: {ve}")
                     except Exception as e:
                         print(f"Неизвестная ошибка при сохранении данных в базу данных: {e}")
+
+                # Вложения готовятся заранее только для кандидатов, которые будут отправлены пользователю,
+                # чтобы не тратить время и квоту VK API на загрузку фотографий остальных
+                for user in saved_candidates[:self.PRELOAD_CANDIDATES]:
+                    self.preload_top_photos(user["id"])
+
+                return saved_candidates
             else:
                 print("Пользователи, соответствующие критериям поиска, не найдены.")
+                return []
+
+    def process_user_message(self, user_id, message_text, messenger=None):
+        """
+        Обрабатывает входящее сообщение: ищет пару для отправителя и отправляет ему лучшего кандидата.
+
+        Поиск (users.search, photos.get) доступен только с пользовательским токеном, а сообщения
+        от имени сообщества отправляются с токеном сообщества, поэтому ответ можно отправить
+        через другой экземпляр VKAPI.
+
+        Параметры:
+            user_id (int): VK ID отправителя сообщения.
+            message_text (str): Текст сообщения.
+            messenger (VKAPI, optional): Экземпляр VKAPI, через который отправляется ответ. По умолчанию текущий.
+        """
+        messenger = messenger or self
+        print(f"Сообщение от пользователя {user_id}: {message_text}")
+
+        candidates = self.get_user_and_search_pairs(user_id)
+        if not candidates:
+            messenger.send_message(user_id, "К сожалению, подходящая пара не найдена. Попробуйте позже.", [])
+            return
+
+        best = candidates[0]
+        message = (
+            f"Вот ваша пара: {best['First Name']} {best['Last Name']}\n"
+            f"https://vk.com/id{best['id']}\n"
+            "Приятного знакомства! 🚀"
+        )
+        messenger.send_message(user_id, message, self.get_top_photos(best["id"], 3))
 
     def get_user_info_by_id(self, user_vk_id):
         """
@@ -418,8 +667,9 @@ class VKAPI:
         else:
             return []  # Вернуть пустой список, если данные о дате рождения недоступны
 
-        age_from = birth_year - 1
-        age_to = birth_year + 1
+        # Широкое окно по году рождения: близость по возрасту учитывается при ранжировании кандидатов
+        age_from = birth_year - self.AGE_WINDOW
+        age_to = birth_year + self.AGE_WINDOW
 
         try:
             response = self._make_request(method, search_params)
@@ -433,20 +683,23 @@ class VKAPI:
                 user_info = self.get_user_info_by_id(user["id"])
                 if user_info and user_info.city and "id" in user_info.city and user_info.city["id"] == city_id:
                     if user_info.bdate:
-                        try:
-                            user_birth_year = datetime.datetime.strptime(user_info.bdate, "%d.%m.%Y").year
-                            if age_from <= user_birth_year <= age_to:
-                                user_dict = {
-                                    "First Name": user_info.first_name,
-                                    "Last Name": user_info.last_name,
-                                    "id": user_info.user_vk_id,
-                                    "Birthday": user_info.bdate,
-                                    "Sex": user_info.sex,
-                                    "City": user_info.city["title"]
-                                }
-                                users.append(user_dict)
-                        except ValueError:
-                            pass  # Игнорировать пользователей с некорректным форматом даты рождения
+                        if user_info.bdate.count(".") == 2:
+                            try:
+                                user_birth_year = datetime.datetime.strptime(user_info.bdate, "%d.%m.%Y").year
+                            except ValueError:
+                                continue  # Игнорировать пользователей с некорректным форматом даты рождения
+                            if not age_from <= user_birth_year <= age_to:
+                                continue
+                        # Пользователи со скрытым годом рождения остаются в пуле и получают низкую оценку по возрасту
+                        user_dict = {
+                            "First Name": user_info.first_name,
+                            "Last Name": user_info.last_name,
+                            "id": user_info.user_vk_id,
+                            "Birthday": user_info.bdate,
+                            "Sex": user_info.sex,
+                            "City": user_info.city["title"]
+                        }
+                        users.append(user_dict)
                     else:
                         pass  # Игнорировать пользователей без информации о дате рождения
 
@@ -454,15 +707,86 @@ class VKAPI:
         except Exception:
             return []  # Вернуть пустой список, если произошла ошибка при поиске пользователей
 
-    def get_all_user_photos(self, user_vk_id):
+    def get_candidate_photo_stats(self, user_vk_ids):
+        """
+        Получает статистику фотографий кандидатов из последнего сбора в таблице 'user_photos'.
+
+        Параметры:
+            user_vk_ids (list): Список VK ID кандидатов.
+
+        Возвращает:
+            dict: Словарь {user_vk_id: (сумма лайков и комментариев, Unix-время последней фотографии)}.
+        """
+        import storage
+
+        if not user_vk_ids:
+            return {}
+
+        conn = None
+
+        try:
+            conn = storage.connect(self.db_params)
+            cursor = conn.cursor()
+
+            # Агрегируем популярность и свежесть фотографий одним запросом для всего пула.
+            # Каждый день сбора хранит полную копию фотографий кандидата, поэтому учитывается
+            # только последний сбор, иначе популярность росла бы с каждым повторным сбором
+            get_stats_query = """
+                WITH latest AS (
+                    SELECT user_vk_id, MAX(harvested_on) AS harvested_on
+                    FROM user_photos
+                    WHERE user_vk_id = ANY(%s)
+                    GROUP BY user_vk_id
+                ), photos AS (
+                    SELECT DISTINCT user_vk_id, photo_url, likes_count, comments_count, photo_date
+                    FROM user_photos
+                    JOIN latest USING (user_vk_id, harvested_on)
+                )
+                SELECT user_vk_id,
+                       SUM(likes_count + comments_count),
+                       EXTRACT(EPOCH FROM MAX(photo_date))
+                FROM photos
+                GROUP BY user_vk_id;
+            """
+            cursor.execute(get_stats_query, (list(user_vk_ids),))
+            return {
+                user_vk_id: (float(popularity or 0), float(last_photo_ts) if last_photo_ts is not None else None)
+                for user_vk_id, popularity, last_photo_ts in cursor.fetchall()
+            }
+        except Exception as e:
+            print(f"Ошибка при получении статистики фотографий кандидатов: {e}")
+            return {}
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def rank_candidates(self, candidates, age):
+        """
+        Ранжирует кандидатов по разнице в возрасте, популярности и свежести уже сохраненных фотографий.
+
+        Параметры:
+            candidates (list): Список словарей кандидатов в формате search_users().
+            age (int): Возраст пользователя, для которого выполняется поиск.
+
+        Возвращает:
+            list: Не более TOP_CANDIDATES кандидатов, упорядоченных по убыванию оценки.
         """
-        Получает все фотографии пользователя из VK API и сохраняет их в базу данных.
+        from ranking import CandidateRanker
+
+        photo_stats = self.get_candidate_photo_stats([candidate["id"] for candidate in candidates])
+        ranker = CandidateRanker(age, self.RANKING_WEIGHTS)
+        ranker.load(candidates, photo_stats)
+        return ranker.top(self.TOP_CANDIDATES)
+
+    def iter_user_photo_pages(self, user_vk_id):
+        """
+        Постранично получает фотографии пользователя из VK API.
 
         Параметры:
-            user_vk_id (int): VK ID пользователя, фотографии которого будут сохранены.
+            user_vk_id (int): VK ID пользователя, фотографии которого запрашиваются.
 
         Возвращает:
-            list: Список словарей с информацией о фотографиях пользователя.
+            generator: Генератор списков PhotoRecord (по одному на страницу).
 
         Исключения:
             ConnectionError: Если произошла ошибка при подключении к API ВКонтакте.
@@ -479,70 +803,69 @@ class VKAPI:
             # Установите количество фотографий, которые необходимо получить за один запрос (можно изменить по необходимости)
         }
 
-        try:
-            photos = []
-
-            while True:
-                response = self._make_request(method, params)
+        fetched_count = 0
 
-                if response is None or "items" not in response:
-                    break  # Нет фотографий для получения или ошибка в ответе, выйти из цикла
+        while True:
+            # Каждая страница сразу сокращается до компактных записей, полные ответы VK не хранятся
+            total_count, page_count, records = parse_photos_page(
+                self._make_raw_request(method, params),
+                self.select_photo_size,
+            )
 
-                photos.extend(response["items"])
+            if not page_count:
+                break  # Нет фотографий для получения или ошибка в ответе, выйти из цикла
 
-                # Проверить, есть ли еще фотографии для получения
-                total_count = response["count"]
-                fetched_count = len(photos)
+            if records:
+                yield records
 
-                # Проверить, если у пользователя больше фотографий, чем получено за запрос
-                if fetched_count >= total_count:
-                    break  # Все фотографии были получены, выйти из цикла
+            # Проверить, есть ли еще фотографии для получения
+            fetched_count += page_count
 
-                # Обновить параметр "offset" для следующего запроса
-                params["offset"] = fetched_count
+            # Проверить, если у пользователя больше фотографий, чем получено за запрос
+            if fetched_count >= total_count:
+                break  # Все фотографии были получены, выйти из цикла
 
-                # Быть ответственным пользователем API и ограничить количество запросов в секунду
-                time.sleep(1 / self.MAX_REQUESTS_PER_SECOND)
+            # Обновить параметр "offset" для следующего запроса
+            params["offset"] = fetched_count
 
-            return photos
-        except Exception as e:
-            print(f"Ошибка при получении фотографий пользователя: {e}")
-            return []
+            # Быть ответственным пользователем API и ограничить количество запросов в секунду
+            time.sleep(1 / self.MAX_REQUESTS_PER_SECOND)
 
-    def save_user_photos_to_db(self, user_vk_id):
+    def get_all_user_photos(self, user_vk_id):
         """
-        Сохраняет информацию и топ-фотографии пользователя в базу данных.
+        Получает все фотографии пользователя из VK API.
 
         Параметры:
-            user_vk_id (int): VK ID пользователя, для которого сохраняется информация и фотографии.
+            user_vk_id (int): VK ID пользователя, фотографии которого запрашиваются.
 
         Возвращает:
-            bool: True, если информация и фотографии успешно сохранены в базу данных, в противном случае False.
+            list: Список PhotoRecord с информацией о фотографиях пользователя.
 
         Исключения:
-            requests.RequestException: Если произошла ошибка при отправке сообщения.
+            ConnectionError: Если произошла ошибка при подключении к API ВКонтакте.
         """
-        user_info = self.get_user_info_by_id(user_vk_id)
-        if user_info is None:
-            print(
-                f"Не удалось сохранить информацию и фотографии пользователя {user_vk_id} в базе данных. Причина: Информация о пользователе недоступна.")
-            return False
-
-        conn = psycopg2.connect(
-            host="localhost",
-            database="postgres",
-            user="postgres",
-            password="05321983"
-        )
-
         try:
-            cursor = conn.cursor()
+            photos = []
+            for page in self.iter_user_photo_pages(user_vk_id):
+                photos.extend(page)
+            return photos
+        except Exception as e:
+            print(f"Ошибка при получении фотографий пользователя: {e}")
+            return []
+
+    def _upsert_user(self, conn, user_info):
+        """
+        Вставляет или обновляет информацию о пользователе в таблице 'users' в короткой транзакции.
 
-            # Начать транзакцию для атомарной операции
-            with conn:
+        Параметры:
+            conn (psycopg2.extensions.connection): Подключение к базе данных.
+            user_info (User): Объект User с информацией о пользователе.
+        """
+        with conn:
+            with conn.cursor() as cursor:
                 # Проверить, существует ли пользователь уже в таблице 'users' на основе user_vk_id
-                check_user_query = "SELECT * FROM users WHERE user_vk_id = %s"
-                cursor.execute(check_user_query, (user_vk_id,))
+                check_user_query = "SELECT 1 FROM users WHERE user_vk_id = %s"
+                cursor.execute(check_user_query, (user_info.user_vk_id,))
                 existing_user = cursor.fetchone()
 
                 if existing_user:
@@ -554,13 +877,13 @@ class VKAPI:
                         user_info.sex,
                         user_info.bdate,
                         user_info.city["title"] if user_info.city else None,
-                        user_vk_id,
+                        user_info.user_vk_id,
                     ))
                 else:
                     # Вставить информацию о пользователе в таблицу 'users', если пользователь не существует
                     insert_user_query = "INSERT INTO users (user_vk_id, first_name, last_name, sex, bdate, city) VALUES (%s, %s, %s, %s, %s, %s)"
                     cursor.execute(insert_user_query, (
-                        user_vk_id,
+                        user_info.user_vk_id,
                         user_info.first_name,
                         user_info.last_name,
                         user_info.sex,
@@ -568,88 +891,228 @@ class VKAPI:
                         user_info.city["title"] if user_info.city else None,
                     ))
 
-                # Получить все фотографии пользователя из всех альбомов
-                all_photos = self.get_all_user_photos(user_vk_id)
+    def _write_photo_batch(self, conn, rows):
+        """
+        Записывает пакет фотографий в таблицу 'user_photos' в короткой транзакции.
 
-                if not all_photos:
-                    print(
-                        f"Не удалось сохранить информацию и фотографии пользователя {user_vk_id} в базу данных. Причина: Фотографии не найдены.")
-                    return False
-
-                # Сохранить фотографии пользователя в таблицу 'user_photos'
-                for photo in all_photos:
-                    largest_size_url = max(photo["sizes"], key=lambda x: x["width"])["url"]
-                    likes_count = photo["likes"]["count"]
-                    comments_count = photo["comments"]["count"]
-                    photo_date = datetime.datetime.fromtimestamp(photo["date"])
-
-                    insert_photo_query = "INSERT INTO user_photos (user_vk_id, photo_url, likes_count, comments_count, photo_date) VALUES (%s, %s, %s, %s, %s)"
-                    cursor.execute(insert_photo_query, (
-                        user_vk_id,
-                        largest_size_url,
-                        likes_count,
-                        comments_count,
-                        photo_date,
-                    ))
+        Параметры:
+            conn (psycopg2.extensions.connection): Подключение к базе данных.
+            rows (list): Список кортежей (user_vk_id, photo_url, likes_count, comments_count, photo_date, harvested_on).
+        """
+        from psycopg2.extras import execute_values
+
+        with conn:
+            with conn.cursor() as cursor:
+                insert_photo_query = "INSERT INTO user_photos (user_vk_id, photo_url, likes_count, comments_count, photo_date, harvested_on) VALUES %s"
+                execute_values(cursor, insert_photo_query, rows, page_size=len(rows))
+
+    def _delete_harvested_photos(self, conn, user_vk_id, harvested_on):
+        """
+        Удаляет фотографии пользователя, собранные в указанный день, в короткой транзакции.
+
+        Параметры:
+            conn (psycopg2.extensions.connection): Подключение к базе данных.
+            user_vk_id (int): VK ID пользователя.
+            harvested_on (datetime.date): Дата сбора фотографий.
+        """
+        with conn:
+            with conn.cursor() as cursor:
+                delete_photos_query = "DELETE FROM user_photos WHERE user_vk_id = %s AND harvested_on = %s"
+                cursor.execute(delete_photos_query, (user_vk_id, harvested_on))
+
+    def _lock_user_photos(self, conn, user_vk_id):
+        """
+        Берет сессионную рекомендательную блокировку на фотографии пользователя.
+
+        Блокировка держится до закрытия подключения, поэтому два одновременных сбора
+        одного пользователя выполняются по очереди и не удаляют строки друг друга.
+
+        Параметры:
+            conn (psycopg2.extensions.connection): Подключение к базе данных.
+            user_vk_id (int): VK ID пользователя.
+        """
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_lock(%s)", (user_vk_id,))
+
+    def save_user_photos_to_db(self, user_vk_id):
+        """
+        Сохраняет информацию и фотографии пользователя в базу данных.
+
+        Страницы фотографий загружаются из API в фоновом потоке через ограниченный буфер,
+        а запись в базу данных выполняется пакетами в коротких транзакциях, поэтому
+        загрузка и запись идут одновременно и блокировки не удерживаются во время сетевых запросов.
+
+        Так как пакеты фиксируются по отдельности, сохранение не атомарно. Вместо этого перед
+        сбором удаляются фотографии пользователя, уже собранные сегодня (повторный запуск не создает
+        дубликатов), а при ошибке посреди сбора удаляются и записанные в этом запуске пакеты.
+        Сборы одного пользователя выполняются по очереди под рекомендательной блокировкой,
+        поэтому очистка после ошибки не затрагивает строки параллельного сбора.
+
+        Параметры:
+            user_vk_id (int): VK ID пользователя, для которого сохраняется информация и фотографии.
+
+        Возвращает:
+            bool: True, если информация и фотографии успешно сохранены в базу данных, в противном случае False.
+
+        Исключения:
+            requests.RequestException: Если произошла ошибка при отправке сообщения.
+        """
+        import storage
+
+        user_info = self.get_user_info_by_id(user_vk_id)
+        if user_info is None:
+            print(
+                f"Не удалось сохранить информацию и фотографии пользователя {user_vk_id} в базе данных. Причина: Информация о пользователе недоступна.")
+            return False
+
+        conn = storage.connect(self.db_params)
+        harvested_on = datetime.date.today()
+        harvest_started = False
+
+        try:
+            # Убедиться, что партиция на дату сбора уже создана
+            storage.ensure_partitions(conn, harvested_on)
+
+            self._upsert_user(conn, user_info)
+            self._lock_user_photos(conn, user_vk_id)
+            self._delete_harvested_photos(conn, user_vk_id, harvested_on)
+            harvest_started = True
+
+            # Страницы загружаются в фоне, пока текущий пакет пишется в базу данных
+            pages = iter_in_background(self.iter_user_photo_pages(user_vk_id), self.PHOTO_BUFFER_PAGES)
+
+            saved_count = 0
+            batch = []
+            try:
+                for page in pages:
+                    for photo in page:
+                        batch.append((
+                            user_vk_id,
+                            photo.url,
+                            photo.likes,
+                            photo.comments,
+                            datetime.datetime.fromtimestamp(photo.date),
+                            harvested_on,
+                        ))
+
+                    if len(batch) >= self.PHOTO_BATCH_SIZE:
+                        self._write_photo_batch(conn, batch)
+                        saved_count += len(batch)
+                        batch = []
+            finally:
+                # Остановить фоновую загрузку страниц до очистки, если запись прервалась ошибкой
+                pages.close()
+
+            if batch:
+                self._write_photo_batch(conn, batch)
+                saved_count += len(batch)
+
+            if not saved_count:
+                print(
+                    f"Не удалось сохранить информацию и фотографии пользователя {user_vk_id} в базу данных. Причина: Фотографии не найдены.")
+                return False
 
             print(
                 f"Информация и фотографии пользователя {user_info.first_name} {user_info.last_name} успешно сохранены в базе данных!")
             return True
         except Exception as e:
             print(f"Ошибка при сохранении данных в базу данных: {e}")
+            if harvest_started:
+                # Не оставлять неполный набор фотографий: удалить пакеты, записанные в этом запуске
+                try:
+                    self._delete_harvested_photos(conn, user_vk_id, harvested_on)
+                except Exception as cleanup_error:
+                    print(f"Не удалось удалить частично сохраненные фотографии пользователя {user_vk_id}: {cleanup_error}")
             return False
         finally:
+            # Закрытие подключения снимает и рекомендательную блокировку
             conn.close()
 
-    def send_top_photos_to_user(self, user_vk_id, user_info):
+    def get_top_photos(self, user_vk_id, limit=3):
         """
-        Отправляет топ-3 популярных фотографии пользователю.
+        Получает самые популярные фотографии пользователя из таблицы 'user_photos'.
 
         Параметры:
-            user_vk_id (int): VK ID пользователя, которому отправляются фотографии.
-            user_info (User): Объект User с информацией о пользователе.
+            user_vk_id (int): VK ID пользователя.
+            limit (int, optional): Количество фотографий. По умолчанию 3.
 
-        Исключения:
-            requests.RequestException: Если произошла ошибка при отправке сообщения.
+        Возвращает:
+            list: Список словарей {"photo_url": URL} в порядке убывания популярности.
         """
+        import storage
 
-        conn = psycopg2.connect(
-            host="localhost",
-            database="postgres",
-            user="postgres",
-            password="05321983"
-        )
+        conn = None
 
         try:
+            conn = storage.connect(self.db_params)
             cursor = conn.cursor()
 
-            # Получить топ-3 популярные профильные фотографии из таблицы 'user_photos' для заданного user_vk_id
+            # Получить топ популярные профильные фотографии из таблицы 'user_photos' для заданного user_vk_id
+            # (только из последнего сбора, чтобы одна фотография не попала в топ несколько раз)
             get_top_photos_query = """
-                SELECT photo_url
+                SELECT DISTINCT photo_url, likes_count + comments_count AS popularity
                 FROM user_photos
                 WHERE user_vk_id = %s
-                ORDER BY (likes_count + comments_count) DESC
-                LIMIT 3;
+                  AND harvested_on = (SELECT MAX(harvested_on) FROM user_photos WHERE user_vk_id = %s)
+                ORDER BY popularity DESC
+                LIMIT %s;
             """
-            cursor.execute(get_top_photos_query, (user_vk_id,))
-            top_photos = cursor.fetchall()
+            cursor.execute(get_top_photos_query, (user_vk_id, user_vk_id, limit))
+            return [{"photo_url": row[0]} for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Ошибка при получении топ-фотографий пользователя: {e}")
+            return []
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def preload_top_photos(self, user_vk_id):
+        """
+        Заранее скачивает в локальный кэш и загружает как вложения топ-фотографии кандидата,
+        чтобы при отправке пар не тратить время на скачивание и загрузку.
+
+        Параметры:
+            user_vk_id (int): VK ID кандидата.
+
+        Возвращает:
+            int: Количество фотографий, для которых подготовлены вложения.
+        """
+        if self.photo_cache is None:
+            return 0
+
+        prepared = 0
+        for photo in self.get_top_photos(user_vk_id, self.PRELOAD_TOP_PHOTOS):
+            if self._get_photo_attachment(None, photo["photo_url"]):
+                prepared += 1
+        return prepared
+
+    def send_top_photos_to_user(self, user_vk_id, user_info):
+        """
+        Отправляет топ-3 популярных фотографии пользователю.
+
+        Параметры:
+            user_vk_id (int): VK ID пользователя, которому отправляются фотографии.
+            user_info (User): Объект User с информацией о пользователе.
+
+        Исключения:
+            requests.RequestException: Если произошла ошибка при отправке сообщения.
+        """
+        try:
+            top_photos = self.get_top_photos(user_vk_id, 3)
 
             if not top_photos:
                 print("У пользователя нет популярных фотографий.")
                 return
 
             # Отправить сообщение пользователю
-            # Включить топ-3 фотографии и ссылки на профиль в сообщение
+            # Фотографии прикладываются вложениями (или отправляются ссылками, если кэш не настроен)
             # Оформить сообщение по вашему желанию
-            message = f"Привет, {user_info.first_name}! Вот топ-3 популярных профильных фотографии для вас:\n"
-            for i, photo in enumerate(top_photos, 1):
-                message += f"{i}. {photo[0]}\n"
+            message = f"Привет, {user_info.first_name}! Вот топ-3 популярных профильных фотографии для вас."
             message += "\nПриятного знакомства! 🚀"
 
             # Отправить сообщение пользователю с помощью метода VK API для отправки сообщений
-            self.send_message(user_vk_id, message)
+            self.send_message(user_vk_id, message, top_photos)
 
         except Exception as e:
             print(f"Ошибка при отправке топ-фотографий пользователю: {e}")
-        finally:
-            conn.close()